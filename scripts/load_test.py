@@ -0,0 +1,469 @@
+import argparse
+import asyncio
+import contextvars
+import importlib
+import json
+import math
+import os
+import resource
+import signal
+import sys
+import tempfile
+import time
+import types
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+from telegram.request import HTTPXRequest
+
+FAKE_TOKEN = "123456:LOADTEST"
+FAKE_BOT_ID = 123456
+STALL_THRESHOLD_SECONDS = 0.05
+MONITOR_INTERVAL_SECONDS = 0.01
+UPLOAD_CHUNK_BYTES = 64 * 1024
+# Same as python-telegram-bot's default for Application.builder()
+CONNECTION_POOL_SIZE = 256
+
+# Smallest valid PDF, used as the report in --offline mode
+MINIMAL_PDF = (
+    b"%PDF-1.4\n1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n"
+    b"2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj\n"
+    b"3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 612 792]>>endobj\n"
+    b"trailer<</Root 1 0 R>>\n%%EOF\n"
+)
+
+
+## Fake Telegram Bot API
+# Local stand-in for api.telegram.org, answers the bot's requests and accepts reply_document uploads
+# Runs in a subprocess (see start_fake_api), so its memory and CPU are not counted in the bot's figures
+class FakeBotAPI:
+    def __init__(self, bot_username, upload_delay):
+        self.bot_username = bot_username
+        self.upload_delay = upload_delay
+        self.message_id = 0
+        self.calls = {}
+        self.documents_received = 0
+        self.bytes_received = 0
+
+    # Builds a Message object, as returned by sendMessage / sendDocument
+    def _message(self, chat_id, text=None):
+        self.message_id += 1
+        chat_type = "group" if chat_id < 0 else "private"
+        message = {
+            "message_id": self.message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": chat_type},
+        }
+        if text is not None:
+            message["text"] = text
+        return message
+
+    # Reads request parameters; uploaded files are read in chunks and only their size is kept
+    async def _read_params(self, request):
+        if request.content_type != "multipart/form-data":
+            return await request.post()
+
+        params = {}
+        reader = await request.multipart()
+        async for part in reader:
+            if part.filename is None:
+                params[part.name] = await part.text()
+                continue
+            size = 0
+            while chunk := await part.read_chunk(UPLOAD_CHUNK_BYTES):
+                size += len(chunk)
+            params[part.name] = size
+        return params
+
+    async def _handle(self, request):
+        method = request.match_info["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        params = await self._read_params(request)
+
+        if method == "getMe":
+            result = {
+                "id": FAKE_BOT_ID,
+                "is_bot": True,
+                "first_name": "LoadTest",
+                "username": self.bot_username.lstrip("@"),
+            }
+        elif method == "sendMessage":
+            result = self._message(int(params["chat_id"]), params.get("text"))
+        elif method == "sendDocument":
+            self.documents_received += 1
+            self.bytes_received += params["document"] if isinstance(params["document"], int) else len(params["document"])
+            await asyncio.sleep(self.upload_delay)
+            result = self._message(int(params["chat_id"]))
+        else:
+            result = True
+
+        return web.json_response({"ok": True, "result": result})
+
+    # Serves until SIGTERM, printing the port when ready and the request counts when stopped
+    async def serve(self):
+        server = web.Application()
+        server.router.add_post("/bot{token}/{method}", self._handle)
+        runner = web.AppRunner(server, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        print(runner.addresses[0][1], flush=True)
+
+        stop = asyncio.Event()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        await stop.wait()
+        await runner.cleanup()
+
+        stats = {"calls": self.calls, "documents": self.documents_received, "bytes": self.bytes_received}
+        print(json.dumps(stats), flush=True)
+
+# Starts this script as the fake Bot API subprocess, returns the process and the bot's base_url
+async def start_fake_api(bot_username, upload_delay):
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.abspath(__file__), "--fake-api",
+        "--bot-username", bot_username, "--upload-delay", str(upload_delay),
+        stdout=asyncio.subprocess.PIPE,
+    )
+    port = int(await process.stdout.readline())
+    return process, f"http://127.0.0.1:{port}/bot"
+
+# Stops the fake Bot API subprocess and returns its request counts
+async def stop_fake_api(process):
+    process.terminate()
+    stats = json.loads(await process.stdout.readline())
+    await process.wait()
+    return stats
+
+
+## Offline mode
+# Installs a stand-in "generator" module with timed versions of the Reddit / database / weasyprint pipeline used by generate_command
+# Must run before telegram_bot is imported, so generator.py and crawler.py (and their dependencies and credentials) are never loaded
+# Blocking steps use time.sleep, the same way plotting and PDF generation block the event loop in generator.py
+class FakeEngine:
+    def dispose(self):
+        pass
+
+def stub_generator_pipeline(report_dir, fetch_seconds, render_seconds):
+    report_path = os.path.join(report_dir, "report.pdf")
+    with open(report_path, "wb") as f:
+        f.write(MINIMAL_PDF)
+    last_generated = [None]
+
+    def regeneration_check(seconds):
+        if last_generated[0] is not None and time.monotonic() - last_generated[0] < seconds:
+            return report_path
+        return None
+
+    async def get_newest_update():
+        await asyncio.sleep(fetch_seconds)
+        return time.time()
+
+    async def connect_database_and_cache_images():
+        await asyncio.sleep(fetch_seconds)
+        return FakeEngine(), None
+
+    def fetch_data_and_plot_graph(engine):
+        time.sleep(render_seconds / 2)
+
+    def generate_html_report(top_memes_data, timestamp):
+        return None
+
+    def generate_pdf_report(html_report_path):
+        time.sleep(render_seconds / 2)
+        last_generated[0] = time.monotonic()
+        return report_path
+
+    generator = types.ModuleType("generator")
+    generator.regeneration_check = regeneration_check
+    generator.get_newest_update = get_newest_update
+    generator.connect_database_and_cache_images = connect_database_and_cache_images
+    generator.fetch_data_and_plot_graph = fetch_data_and_plot_graph
+    generator.generate_html_report = generate_html_report
+    generator.generate_pdf_report = generate_pdf_report
+    sys.modules["generator"] = generator
+
+
+## Delivery timing
+# Update being handled by the current task, set before the bot's handlers run
+current_update_id = contextvars.ContextVar("current_update_id", default=None)
+
+# Bot request that records when the fake Bot API has accepted a reply_document upload, per update
+class DeliveryTimingRequest(HTTPXRequest):
+    def __init__(self, on_delivered):
+        super().__init__(connection_pool_size=CONNECTION_POOL_SIZE)
+        self.on_delivered = on_delivered
+
+    async def do_request(self, url, *args, **kwargs):
+        result = await super().do_request(url, *args, **kwargs)
+        if url.endswith("/sendDocument") and current_update_id.get() is not None:
+            self.on_delivered(current_update_id.get(), time.monotonic())
+        return result
+
+
+## Synthetic updates
+# Builds a /generate message from a simulated user, mentioning the bot in group chats
+def make_generate_update(bot, update_id, user_id, in_group):
+    text = f"/generate@{bot.username}" if in_group else "/generate"
+    if in_group:
+        chat = {"id": -user_id, "type": "group", "title": f"Load test group {user_id}"}
+    else:
+        chat = {"id": user_id, "type": "private"}
+    data = {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": chat,
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}],
+        },
+    }
+    return Update.de_json(data, bot)
+
+# Spaces out update injection so that at most "rate" updates are sent per second across all users (closed loop mode)
+class RateLimiter:
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate > 0 else 0
+        self.next_slot = 0
+
+    async def wait(self):
+        now = time.monotonic()
+        slot = max(now, self.next_slot)
+        self.next_slot = slot + self.interval
+        await asyncio.sleep(slot - now)
+
+
+## Measurements
+# Samples how late the event loop wakes up, anything over the threshold counts as blocked time
+async def monitor_event_loop(stats, stop):
+    while not stop.is_set():
+        start = time.monotonic()
+        await asyncio.sleep(MONITOR_INTERVAL_SECONDS)
+        lag = time.monotonic() - start - MONITOR_INTERVAL_SECONDS
+        if lag > STALL_THRESHOLD_SECONDS:
+            stats["blocked_seconds"] += lag
+            stats["stalls"] += 1
+        stats["max_stall_seconds"] = max(stats["max_stall_seconds"], lag)
+
+# Nearest-rank percentile of a sorted list
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return float("nan")
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+# Formats a duration in seconds, or "n/a" when there was nothing to measure
+def format_seconds(value):
+    return "n/a" if math.isnan(value) else f"{value:.3f}s"
+
+# Peak resident set size of this process in MB (ru_maxrss is in bytes on macOS, kilobytes on Linux)
+def peak_rss_mb():
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+
+
+## Load generator
+# Sends one /generate update, waits for the bot to finish handling it and records exactly one outcome:
+# "delivered" (the report was uploaded), "no_reply" (the handler finished without uploading it) or "timeout"
+# Latency runs from "due", when the update was scheduled to be sent, until the report was uploaded
+async def send_update(app, user_id, in_group, due, args, state):
+    state["sent"] += 1
+    update_id = state["sent"]
+
+    handled = asyncio.get_running_loop().create_future()
+    state["pending"][update_id] = handled
+    await app.update_queue.put(make_generate_update(app.bot, update_id, user_id, in_group))
+
+    try:
+        await asyncio.wait_for(asyncio.shield(handled), args.timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        state["pending"].pop(update_id, None)
+
+    if update_id in state["delivered"]:
+        state["outcomes"][update_id] = "delivered"
+        state["latencies"].append(state["delivered"][update_id] - due)
+    elif handled.done():
+        state["outcomes"][update_id] = "no_reply"
+    else:
+        state["outcomes"][update_id] = "timeout"
+
+# Closed loop: each simulated user sends /generate and waits for the bot to finish before sending the next one
+# --rate only caps the send rate, so the offered load drops when the bot slows down
+async def simulate_user(app, user_id, in_group, args, limiter, state):
+    while state["sent"] < args.requests:
+        await limiter.wait()
+        if state["sent"] >= args.requests:
+            return
+        await send_update(app, user_id, in_group, time.monotonic(), args, state)
+
+# Open loop: sends /generate at a fixed --rate regardless of outstanding replies, round robin over the simulated users
+# Queueing delay shows up in latency, which is what sizing the deployment needs
+async def simulate_open_loop(app, group_users, args, state):
+    interval = 1 / args.rate
+    start = time.monotonic()
+    tasks = []
+    for i in range(args.requests):
+        due = start + i * interval
+        await asyncio.sleep(max(0, due - time.monotonic()))
+        user_id = i % args.users + 1
+        tasks.append(asyncio.create_task(send_update(app, user_id, user_id <= group_users, due, args, state)))
+    await asyncio.gather(*tasks)
+
+async def run_load_test(telegram_bot, args):
+    fake_api, base_url = await start_fake_api(telegram_bot.BOT_USERNAME, args.upload_delay)
+
+    state = {"sent": 0, "pending": {}, "delivered": {}, "errors": {}, "outcomes": {}, "latencies": []}
+
+    # Only updates still being waited on are recorded, late ones already have their outcome
+    def record_delivery(update_id, delivered_at):
+        if update_id in state["pending"]:
+            state["delivered"][update_id] = delivered_at
+
+    app = (
+        Application.builder()
+        .token(FAKE_TOKEN)
+        .base_url(base_url)
+        .request(DeliveryTimingRequest(record_delivery))
+        .updater(None)
+        .concurrent_updates(args.concurrent_updates)
+        .build()
+    )
+    telegram_bot.add_handlers(app)
+    # The bot's error handler prints every failing Update, errors are summarised in the report instead
+    app.remove_error_handler(telegram_bot.error)
+
+    # Runs before the command handler (group 0), so its uploads can be attributed to the update
+    async def mark_start(update: Update, context):
+        current_update_id.set(update.update_id)
+
+    # Runs after the command handler has finished, whether or not it raised
+    async def mark_done(update: Update, context):
+        handled = state["pending"].get(update.update_id)
+        if handled is not None and not handled.done():
+            handled.set_result(None)
+
+    # Handler errors are counted on their own, a report delivered before the error still counts as delivered
+    async def record_error(update: Update, context):
+        if update.update_id in state["pending"]:
+            state["errors"][update.update_id] = f"{type(context.error).__name__}: {context.error}"
+
+    app.add_handler(TypeHandler(Update, mark_start), group=-1)
+    app.add_handler(TypeHandler(Update, mark_done), group=1)
+    app.add_error_handler(record_error)
+
+    loop_stats = {"blocked_seconds": 0.0, "stalls": 0, "max_stall_seconds": 0.0}
+    stop_monitor = asyncio.Event()
+    group_users = round(args.users * args.group_ratio)
+
+    async with app:
+        await app.start()
+        monitor = asyncio.create_task(monitor_event_loop(loop_stats, stop_monitor))
+
+        start = time.monotonic()
+        if args.open_loop:
+            await simulate_open_loop(app, group_users, args, state)
+        else:
+            limiter = RateLimiter(args.rate)
+            await asyncio.gather(*[
+                simulate_user(app, user_id, user_id <= group_users, args, limiter, state)
+                for user_id in range(1, args.users + 1)
+            ])
+        elapsed = time.monotonic() - start
+
+        stop_monitor.set()
+        await monitor
+        await app.stop()
+
+    fake_api_stats = await stop_fake_api(fake_api)
+    print_report(args, state, loop_stats, fake_api_stats, elapsed)
+
+
+## Report
+def print_report(args, state, loop_stats, fake_api_stats, elapsed):
+    latencies = sorted(state["latencies"])
+    outcomes = list(state["outcomes"].values())
+    if args.open_loop:
+        mode = f"open loop at {args.rate}/s"
+    else:
+        mode = f"closed loop, rate cap: {args.rate or 'unlimited'}/s"
+
+    print()
+    print(f"Users: {args.users} ({round(args.users * args.group_ratio)} in groups), {mode}")
+    print(f"concurrent_updates: {args.concurrent_updates}, wall time: {elapsed:.2f}s")
+    print(
+        f"Requests sent: {state['sent']}, delivered: {outcomes.count('delivered')}, "
+        f"no reply: {outcomes.count('no_reply')}, timeouts: {outcomes.count('timeout')}"
+    )
+    print(f"Throughput (delivered reports): {len(latencies) / elapsed:.2f} req/s")
+    print(
+        f"Latency (delivered reports) p50: {format_seconds(percentile(latencies, 50))}, "
+        f"p95: {format_seconds(percentile(latencies, 95))}, p99: {format_seconds(percentile(latencies, 99))}, "
+        f"max: {format_seconds(latencies[-1] if latencies else float('nan'))}"
+    )
+    print(
+        f"Event loop blocked: {loop_stats['blocked_seconds']:.2f}s over {loop_stats['stalls']} stalls "
+        f"(>{STALL_THRESHOLD_SECONDS * 1000:.0f}ms), longest: {loop_stats['max_stall_seconds']:.3f}s"
+    )
+    print(f"Peak RSS (bot process only): {peak_rss_mb():.1f} MB")
+    print(f"Fake Bot API: {fake_api_stats['documents']} documents ({fake_api_stats['bytes'] / 1024:.1f} KB)")
+    print(f"Fake Bot API calls: {fake_api_stats['calls']}")
+
+    # Handler errors grouped by error, most common first
+    if state["errors"]:
+        delivered_anyway = sum(1 for update_id in state["errors"] if state["outcomes"].get(update_id) == "delivered")
+        print(f"Handler errors: {len(state['errors'])} ({delivered_anyway} after the report was delivered)")
+        errors = {}
+        for error in state["errors"].values():
+            errors[error] = errors.get(error, 0) + 1
+        for error, count in sorted(errors.items(), key=lambda item: item[1], reverse=True):
+            print(f"  {count} x {error}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Load test telegram_bot.py by injecting /generate updates from simulated users against a local fake Bot API"
+    )
+    parser.add_argument("--users", type=int, default=10,
+                        help="number of simulated chats; in closed loop mode, each waits for its reply before sending again")
+    parser.add_argument("--requests", type=int, default=100, help="total number of /generate updates to send")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="closed loop: max updates per second across all users (0 = unlimited); open loop: fixed updates per second")
+    parser.add_argument("--open-loop", action="store_true",
+                        help="send updates at a fixed --rate regardless of outstanding replies, so queueing delay shows up in latency")
+    parser.add_argument("--group-ratio", type=float, default=0.5, help="fraction of simulated users that are group chats")
+    parser.add_argument("--concurrent-updates", type=int, default=1,
+                        help="Application concurrent_updates setting (1 = sequential, as telegram_bot.py runs)")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds to wait for the bot before counting a timeout")
+    parser.add_argument("--upload-delay", type=float, default=0,
+                        help="seconds the fake Bot API takes to accept each reply_document upload")
+    parser.add_argument("--offline", action="store_true", help="replace the Reddit / database / PDF pipeline with timed stand-ins")
+    parser.add_argument("--fetch-seconds", type=float, default=0.5, help="(offline) non-blocking time per Reddit / database step")
+    parser.add_argument("--render-seconds", type=float, default=1.0,
+                        help="(offline) event loop blocking time for plotting and PDF generation")
+    # Used internally to run the fake Bot API subprocess
+    parser.add_argument("--fake-api", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--bot-username", default="", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.open_loop and args.rate <= 0:
+        parser.error("--open-loop needs a --rate above 0")
+    return args
+
+async def main(args):
+    with tempfile.TemporaryDirectory(prefix="load_test_") as report_dir:
+        if args.offline:
+            stub_generator_pipeline(report_dir, args.fetch_seconds, args.render_seconds)
+        # Imported here so that offline mode can install its stand-in generator module first
+        telegram_bot = importlib.import_module("telegram_bot")
+        await run_load_test(telegram_bot, args)
+
+
+## Run load test
+if __name__ == '__main__':
+    args = parse_args()
+    if args.fake_api:
+        asyncio.run(FakeBotAPI(args.bot_username, args.upload_delay).serve())
+    else:
+        asyncio.run(main(args))
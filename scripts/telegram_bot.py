@@ -81,11 +81,9 @@ async def error(update: Update, context: ContextTypes.DEFAULT_TYPE):
     print(f"Update {update} caused error {context.error}")
 
 
-## Run bot by simple polling
-if __name__ == '__main__':
-    print("Starting bot ...")
-    app = Application.builder().token(TOKEN).build()
-    
+## Register handlers
+# Shared by the polling bot below and the load testing harness (load_test.py)
+def add_handlers(app: Application):
     app.add_handler(CommandHandler("start", start_command))
     app.add_handler(CommandHandler("help", help_command))
     app.add_handler(CommandHandler("generate", generate_command))
@@ -94,5 +92,12 @@ if __name__ == '__main__':
 
     app.add_error_handler(error)
 
+
+## Run bot by simple polling
+if __name__ == '__main__':
+    print("Starting bot ...")
+    app = Application.builder().token(TOKEN).build()
+    add_handlers(app)
+
     print("Polling ...")
     app.run_polling(poll_interval=2)